@@ -1,49 +1,76 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel, Field
-from typing import List, Optional, Union
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, Any, Callable, Deque, List, Optional, Tuple
+from collections import deque
 from datetime import datetime
+import asyncio
 import json
 import logging
+import os
+from operator import attrgetter
+import re
 import uuid
+import orjson
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the ingest pipeline (queue, storage lock, batch flusher) for the app's lifetime"""
+    await _start_ingest()
+    try:
+        yield
+    finally:
+        await _stop_ingest()
+
 app = FastAPI(
     title="Bronze DBO Trans HST2 Webhook Service",
     description="Confluent Kafka HTTP Sink Connector Webhook for bronze_dbo_trans_hst2 Topic",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
+# Integers are limited to the signed 64-bit range so records stay JSON-serializable
+Int64 = Annotated[int, Field(ge=-2**63, le=2**63 - 1)]
+
 # Bronze Trans HST2 Data Model (21 fields from Delta table)
 class BronzeTransHst2(BaseModel):
-    authorizer_usrnbr: Optional[int] = Field(default=None, description="Authorizer user number")
+    # Payload keys outside the 21 table fields are dropped on validation
+    model_config = ConfigDict(extra='ignore')
+    
+    authorizer_usrnbr: Optional[Int64] = Field(default=None, description="Authorizer user number")
     creat_time: Optional[str] = Field(default=None, description="Creation timestamp")
-    creat_usrnbr: Optional[int] = Field(default=None, description="Creator user number")
+    creat_usrnbr: Optional[Int64] = Field(default=None, description="Creator user number")
     data: Optional[str] = Field(default=None, description="Transaction data")
     description: Optional[str] = Field(default=None, description="Description")
     description2: Optional[str] = Field(default=None, description="Secondary description")
     external_user: Optional[str] = Field(default=None, description="External user")
-    four_eye_on: Optional[int] = Field(default=None, description="Four eye flag")
+    four_eye_on: Optional[Int64] = Field(default=None, description="Four eye flag")
     name: Optional[str] = Field(default=None, description="Name")
-    next_seqnbr: Optional[int] = Field(default=None, description="Next sequence number")
-    oper: Optional[int] = Field(default=None, description="Operation")
-    owner_usrnbr: Optional[int] = Field(default=None, description="Owner user number")
-    protection: Optional[int] = Field(default=None, description="Protection level")
-    record_id: Optional[int] = Field(default=None, description="Record ID")
-    seqnbr: Optional[int] = Field(default=None, description="Sequence number")
-    size: Optional[int] = Field(default=None, description="Size")
-    transnbr: Optional[int] = Field(default=None, description="Transaction number")
-    trans_record_type: Optional[int] = Field(default=None, description="Transaction record type")
+    next_seqnbr: Optional[Int64] = Field(default=None, description="Next sequence number")
+    oper: Optional[Int64] = Field(default=None, description="Operation")
+    owner_usrnbr: Optional[Int64] = Field(default=None, description="Owner user number")
+    protection: Optional[Int64] = Field(default=None, description="Protection level")
+    record_id: Optional[Int64] = Field(default=None, description="Record ID")
+    seqnbr: Optional[Int64] = Field(default=None, description="Sequence number")
+    size: Optional[Int64] = Field(default=None, description="Size")
+    transnbr: Optional[Int64] = Field(default=None, description="Transaction number")
+    trans_record_type: Optional[Int64] = Field(default=None, description="Transaction record type")
     updat_time: Optional[str] = Field(default=None, description="Update timestamp")
-    updat_usrnbr: Optional[int] = Field(default=None, description="Updater user number")
-    version: Optional[int] = Field(default=None, description="Version")
+    updat_usrnbr: Optional[Int64] = Field(default=None, description="Updater user number")
+    version: Optional[Int64] = Field(default=None, description="Version")
     
     # Metadata
     received_at: datetime = Field(default_factory=datetime.now)
-    processing_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    processing_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+
+# Bound once so the parse hot path skips the class attribute lookup
+_BRONZE_VALIDATOR = BronzeTransHst2.__pydantic_validator__
 
 class BronzeResponse(BaseModel):
     total_received: int
@@ -61,253 +88,443 @@ class HealthResponse(BaseModel):
     uptime_info: str
 
 # In-memory storage
+MAX_STORED_RECORDS = 10
 record_counter = 0
-bronze_storage: List[BronzeTransHst2] = []
+bronze_storage: Deque[BronzeTransHst2] = deque(maxlen=MAX_STORED_RECORDS)
+
+# Optional shared storage: set REDIS_URL to keep records and the counter in Redis,
+# so the service can run with several uvicorn workers or instances
+REDIS_URL = os.getenv("REDIS_URL")
+_REDIS_RECORDS_KEY = "bronze:last10"
+_REDIS_COUNTER_KEY = "bronze:counter"
+# Bumped by every reset; flushers in any worker drop records received under an older epoch
+_REDIS_EPOCH_KEY = "bronze:epoch"
+_redis = None
+
+# Ingest batching (records are queued by the webhook and flushed to storage in batches)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "100"))
+BATCH_MAX_DELAY_MS = int(os.getenv("BATCH_MAX_DELAY_MS", "50"))
+INGEST_QUEUE_MAX_SIZE = 10_000
+# Created at startup so they belong to the running event loop
+_ingest_queue: Optional[asyncio.Queue] = None
+_storage_lock: Optional[asyncio.Lock] = None
+_flusher_task: Optional[asyncio.Task] = None
+# Queue items are (storage epoch at receipt, record); see _REDIS_EPOCH_KEY
+_QueuedRecord = Tuple[int, BronzeTransHst2]
+# Records taken off the queue by the flusher but not yet stored
+_pending_batch: List[_QueuedRecord] = []
+# Seconds to wait before retrying a batch that failed to store
+FLUSH_RETRY_DELAY = 1
+
+# Avro JSON encodes nullable fields as single-key unions, e.g. {"int": 123};
+# these are unwrapped so such messages validate instead of becoming error records
+_AVRO_UNION_TYPES = frozenset(('int', 'long', 'float', 'double', 'boolean', 'string', 'bytes'))
+
+# AVRO fallback pattern, compiled once and matched in a single pass
+_AVRO_FIELDS = (
+    'authorizer_usrnbr', 'creat_time', 'creat_usrnbr', 'data', 'description',
+    'description2', 'external_user', 'four_eye_on', 'name', 'next_seqnbr',
+    'oper', 'owner_usrnbr', 'protection', 'record_id', 'seqnbr', 'size',
+    'transnbr', 'trans_record_type', 'updat_time', 'updat_usrnbr', 'version'
+)
+_AVRO_PATTERN = re.compile(
+    rf'"(?P<field>{"|".join(_AVRO_FIELDS)})"\s*:\s*(?:'
+    r'\{\s*"int"\s*:\s*(\d+)\s*\}'  # {"int": 123}
+    r'|\{\s*"string"\s*:\s*"([^"]+)"\s*\}'  # {"string": "value"}
+    r'|(\d+)'  # direct number
+    r'|"([^"]+)"'  # direct string
+    r')'
+)
 
 # Message Parser for Confluent HTTP Sink Connector
-class ConfluentMessageParser:
-    
-    @staticmethod
-    def parse_confluent_message(raw_data: str) -> BronzeTransHst2:
-        """Parse message from Confluent HTTP Sink Connector"""
+def parse_confluent_message(raw_data: bytes) -> BronzeTransHst2:
+    """Parse message from Confluent HTTP Sink Connector"""
+    try:
+        logger.info(f"Parsing Confluent message: {len(raw_data)} bytes")
+        
+        # Try JSON parsing first (orjson reads the raw bytes directly)
         try:
-            logger.info(f"Parsing Confluent message: {len(raw_data)} characters")
-            
-            # Try JSON parsing first
+            json_data = orjson.loads(raw_data)
+        except orjson.JSONDecodeError:
+            avro_string = raw_data.decode('utf-8', errors='replace')
             try:
-                json_data = json.loads(raw_data)
-                return ConfluentMessageParser._parse_json_message(json_data)
+                # Retry as JSON allowing raw control characters inside strings (kept as-is)
+                json_data = json.loads(avro_string, strict=False)
             except json.JSONDecodeError:
-                # If not JSON, try AVRO string parsing
-                return ConfluentMessageParser._parse_avro_string(raw_data)
-                
-        except Exception as e:
-            logger.error(f"Message parsing failed: {e}")
-            return ConfluentMessageParser._create_error_record(raw_data, str(e))
-    
-    @staticmethod
-    def _parse_json_message(json_data: dict) -> BronzeTransHst2:
-        """Parse JSON format message"""
-        
-        # Handle different JSON structures from Confluent
-        if 'value' in json_data:
-            data = json_data['value']
-        elif 'payload' in json_data:
-            data = json_data['payload']
-        else:
-            data = json_data
-        
-        # Convert timestamp fields (handle both string and long formats)
-        creat_time = ConfluentMessageParser._convert_timestamp(data.get('creat_time'))
-        updat_time = ConfluentMessageParser._convert_timestamp(data.get('updat_time'))
+                # If still not JSON, try AVRO string parsing
+                return _parse_avro_string(avro_string)
         
-        return BronzeTransHst2(
-            authorizer_usrnbr=data.get('authorizer_usrnbr'),
-            creat_time=creat_time,
-            creat_usrnbr=data.get('creat_usrnbr'),
-            data=data.get('data'),
-            description=data.get('description'),
-            description2=data.get('description2'),
-            external_user=data.get('external_user'),
-            four_eye_on=data.get('four_eye_on'),
-            name=data.get('name'),
-            next_seqnbr=data.get('next_seqnbr'),
-            oper=data.get('oper'),
-            owner_usrnbr=data.get('owner_usrnbr'),
-            protection=data.get('protection'),
-            record_id=data.get('record_id'),
-            seqnbr=data.get('seqnbr'),
-            size=data.get('size'),
-            transnbr=data.get('transnbr'),
-            trans_record_type=data.get('trans_record_type'),
-            updat_time=updat_time,
-            updat_usrnbr=data.get('updat_usrnbr'),
-            version=data.get('version')
-        )
-    
-    @staticmethod
-    def _parse_avro_string(avro_string: str) -> BronzeTransHst2:
-        """Parse AVRO string format (fallback method)"""
-        import re
-        
-        def extract_value(field_name: str) -> Union[str, int, None]:
-            # Try different AVRO patterns
-            patterns = [
-                rf'"{field_name}"\s*:\s*{{\s*"int"\s*:\s*(\d+)\s*}}',  # {"int": 123}
-                rf'"{field_name}"\s*:\s*{{\s*"string"\s*:\s*"([^"]+)"\s*}}',  # {"string": "value"}
-                rf'"{field_name}"\s*:\s*(\d+)',  # direct number
-                rf'"{field_name}"\s*:\s*"([^"]+)"'  # direct string
-            ]
+        return _parse_json_message(json_data)
             
-            for pattern in patterns:
-                match = re.search(pattern, avro_string)
-                if match:
-                    value = match.group(1)
-                    # Try to convert to int if it's a number
-                    try:
-                        return int(value)
-                    except ValueError:
-                        return value
-            return None
+    except Exception as e:
+        logger.error(f"Message parsing failed: {e}")
+        return _create_error_record(raw_data, str(e))
+
+def _parse_json_message(json_data: dict) -> BronzeTransHst2:
+    """Parse JSON format message"""
+    
+    # Handle different JSON structures from Confluent
+    if 'value' in json_data:
+        data = json_data['value']
+    elif 'payload' in json_data:
+        data = json_data['payload']
+    else:
+        data = json_data
+    
+    # Copy with Avro unions unwrapped (only dict values can be unions); metadata is ours to set
+    data = {key: (_unwrap_avro_union(value) if type(value) is dict else value) for key, value in data.items()}
+    data.pop('received_at', None)
+    data.pop('processing_id', None)
+    
+    # Convert timestamp fields (handle both string and long formats)
+    convert_timestamp = _convert_timestamp
+    data['creat_time'] = convert_timestamp(data.get('creat_time'))
+    data['updat_time'] = convert_timestamp(data.get('updat_time'))
+    
+    # Unknown keys are ignored by the model
+    return _BRONZE_VALIDATOR.validate_python(data)
+
+def _unwrap_avro_union(value):
+    """Return the inner value of an Avro union wrapper such as {"int": 123}"""
+    if type(value) is dict and len(value) == 1:
+        type_name, inner = next(iter(value.items()))
+        if type_name in _AVRO_UNION_TYPES:
+            return inner
+    return value
+
+def _parse_avro_string(avro_string: str) -> BronzeTransHst2:
+    """Parse AVRO string format (fallback method)"""
+    fields = {}
+    
+    for match in _AVRO_PATTERN.finditer(avro_string):
+        field_name = match.group('field')
+        # Keep the first occurrence of each field
+        if field_name in fields:
+            continue
         
-        return BronzeTransHst2(
-            authorizer_usrnbr=extract_value('authorizer_usrnbr'),
-            creat_time=extract_value('creat_time'),
-            creat_usrnbr=extract_value('creat_usrnbr'),
-            data=extract_value('data'),
-            description=extract_value('description'),
-            description2=extract_value('description2'),
-            external_user=extract_value('external_user'),
-            four_eye_on=extract_value('four_eye_on'),
-            name=extract_value('name'),
-            next_seqnbr=extract_value('next_seqnbr'),
-            oper=extract_value('oper'),
-            owner_usrnbr=extract_value('owner_usrnbr'),
-            protection=extract_value('protection'),
-            record_id=extract_value('record_id'),
-            seqnbr=extract_value('seqnbr'),
-            size=extract_value('size'),
-            transnbr=extract_value('transnbr'),
-            trans_record_type=extract_value('trans_record_type'),
-            updat_time=extract_value('updat_time'),
-            updat_usrnbr=extract_value('updat_usrnbr'),
-            version=extract_value('version')
-        )
+        value = next(group for group in match.groups()[1:] if group is not None)
+        # Try to convert to int if it's a number
+        try:
+            fields[field_name] = int(value)
+        except ValueError:
+            fields[field_name] = value
     
-    @staticmethod
-    def _convert_timestamp(timestamp_value) -> Optional[str]:
-        """Convert timestamp from various formats to ISO string"""
-        if not timestamp_value:
-            return None
-            
+    return _BRONZE_VALIDATOR.validate_python(fields)
+
+def _convert_timestamp(timestamp_value) -> Optional[str]:
+    """Convert timestamp from various formats to ISO string"""
+    if not timestamp_value:
+        return None
+    
+    # If it's already a string, return it (the common case)
+    if isinstance(timestamp_value, str):
+        return timestamp_value
+    
+    # If it's a timestamp in milliseconds, convert it
+    if isinstance(timestamp_value, (int, float)):
         try:
-            # If it's already a string, return it
-            if isinstance(timestamp_value, str):
-                return timestamp_value
-            
-            # If it's a timestamp in milliseconds, convert it
-            if isinstance(timestamp_value, (int, float)):
-                if timestamp_value > 1e12:  # Milliseconds
-                    dt = datetime.fromtimestamp(timestamp_value / 1000)
-                else:  # Seconds
-                    dt = datetime.fromtimestamp(timestamp_value)
-                return dt.isoformat()
-                
+            if timestamp_value > 1_000_000_000_000:  # Milliseconds
+                dt = datetime.fromtimestamp(timestamp_value / 1000)
+            else:  # Seconds
+                dt = datetime.fromtimestamp(timestamp_value)
+            return dt.isoformat()
         except Exception as e:
             logger.warning(f"Timestamp conversion failed: {e}")
-            
-        return str(timestamp_value)
-    
-    @staticmethod
-    def _create_error_record(raw_data: str, error_msg: str) -> BronzeTransHst2:
-        """Create error record when parsing fails"""
-        return BronzeTransHst2(
-            record_id=-1,
-            data=f"PARSE_ERROR: {error_msg}",
-            description=raw_data[:100] + ("..." if len(raw_data) > 100 else ""),
-            name="PARSING_FAILED",
-            creat_time=datetime.now().isoformat()
-        )
+        
+    return str(timestamp_value)
+
+def _create_error_record(raw_data: bytes, error_msg: str) -> BronzeTransHst2:
+    """Create error record when parsing fails"""
+    now = datetime.now()
+    return BronzeTransHst2(
+        record_id=-1,
+        data=f"PARSE_ERROR: {error_msg}",
+        description=raw_data[:100].decode('utf-8', errors='replace') + ("..." if len(raw_data) > 100 else ""),
+        name="PARSING_FAILED",
+        creat_time=now.isoformat(),
+        received_at=now
+    )
 
 # Helper function for dashboard
+_FIELD_GETTERS: Tuple[Tuple[str, Callable[[BronzeTransHst2], Any]], ...] = (
+    ("Record ID", attrgetter("record_id")),
+    ("Transaction Number", attrgetter("transnbr")),
+    ("Sequence Number", attrgetter("seqnbr")),
+    ("Creator User", attrgetter("creat_usrnbr")),
+    ("Create Time", attrgetter("creat_time")),
+    ("Update Time", attrgetter("updat_time")),
+    ("Authorizer User", attrgetter("authorizer_usrnbr")),
+    ("Owner User", attrgetter("owner_usrnbr")),
+    ("Name", attrgetter("name")),
+    ("Description", attrgetter("description")),
+    ("Description 2", attrgetter("description2")),
+    ("Data", attrgetter("data")),
+    ("External User", attrgetter("external_user")),
+    ("Operation", attrgetter("oper")),
+    ("Protection", attrgetter("protection")),
+    ("Four Eye On", attrgetter("four_eye_on")),
+    ("Next Seq Number", attrgetter("next_seqnbr")),
+    ("Size", attrgetter("size")),
+    ("Trans Record Type", attrgetter("trans_record_type")),
+    ("Update User", attrgetter("updat_usrnbr")),
+    ("Version", attrgetter("version"))
+)
+
 def _generate_records_html(records: List[BronzeTransHst2]) -> str:
     """Generate HTML for records list"""
     if not records:
         return '<div class="no-records">📭 No records received yet. Waiting for Kafka messages...</div>'
     
-    html = ""
-    for idx, record in enumerate(records):
+    parts: List[str] = []
+    for record in records:
         # Format received time
         received_time = record.received_at.strftime('%Y-%m-%d %H:%M:%S') if record.received_at else 'Unknown'
         
         # Create field list (only show non-null values)
-        fields_html = ""
-        field_data = [
-            ("Record ID", record.record_id),
-            ("Transaction Number", record.transnbr),
-            ("Sequence Number", record.seqnbr),
-            ("Creator User", record.creat_usrnbr),
-            ("Create Time", record.creat_time),
-            ("Update Time", record.updat_time),
-            ("Authorizer User", record.authorizer_usrnbr),
-            ("Owner User", record.owner_usrnbr),
-            ("Name", record.name),
-            ("Description", record.description),
-            ("Description 2", record.description2),
-            ("Data", record.data),
-            ("External User", record.external_user),
-            ("Operation", record.oper),
-            ("Protection", record.protection),
-            ("Four Eye On", record.four_eye_on),
-            ("Next Seq Number", record.next_seqnbr),
-            ("Size", record.size),
-            ("Trans Record Type", record.trans_record_type),
-            ("Update User", record.updat_usrnbr),
-            ("Version", record.version)
-        ]
-        
-        for field_name, field_value in field_data:
+        field_parts: List[str] = []
+        for field_name, getter in _FIELD_GETTERS:
+            field_value = getter(record)
             if field_value is not None:
                 # Truncate long values
                 display_value = str(field_value)
                 if len(display_value) > 50:
                     display_value = display_value[:50] + "..."
                 
-                fields_html += f'''
+                field_parts.append(f'''
                 <div class="field">
                     <span class="field-name">{field_name}:</span>
                     <span class="field-value">{display_value}</span>
                 </div>
-                '''
+                ''')
         
-        html += f'''
+        parts.append(f'''
         <div class="record-card">
             <div class="record-header">
                 <span class="record-id">#{record.record_id or 'N/A'}</span>
                 <span class="received-time">📅 {received_time}</span>
             </div>
             <div class="record-fields">
-                {fields_html}
+                {"".join(field_parts)}
             </div>
         </div>
-        '''
+        ''')
+    
+    return "".join(parts)
+
+# Record storage (Redis when REDIS_URL is set, otherwise in-memory)
+async def _count_record() -> Tuple[int, int]:
+    """Count one received record and return the new total and the current storage epoch"""
+    global record_counter
+    
+    if _redis is not None:
+        async with _redis.pipeline(transaction=True) as pipe:
+            pipe.incr(_REDIS_COUNTER_KEY)
+            pipe.get(_REDIS_EPOCH_KEY)
+            total_count, epoch = await pipe.execute()
+        return total_count, int(epoch or 0)
+    
+    # In-memory resets clear the queue and pending batch directly, so no epoch is needed
+    record_counter += 1
+    return record_counter, 0
+
+async def _get_record_count() -> int:
+    """Total number of records received"""
+    if _redis is not None:
+        return int(await _redis.get(_REDIS_COUNTER_KEY) or 0)
+    return record_counter
+
+async def _store_records(batch: List[_QueuedRecord]) -> None:
+    """Append records (oldest first) to storage, keeping only the last MAX_STORED_RECORDS"""
+    if _redis is not None:
+        async with _redis.pipeline(transaction=True) as pipe:
+            # WATCH makes the write fail (and be retried) if any worker resets meanwhile
+            await pipe.watch(_REDIS_EPOCH_KEY)
+            epoch = int(await pipe.get(_REDIS_EPOCH_KEY) or 0)
+            # Drop records received before the latest reset
+            records = [record.model_dump_json() for record_epoch, record in batch if record_epoch == epoch]
+            if not records:
+                return
+            # LPUSH puts the newest record at the head of the list
+            pipe.multi()
+            pipe.lpush(_REDIS_RECORDS_KEY, *records)
+            pipe.ltrim(_REDIS_RECORDS_KEY, 0, MAX_STORED_RECORDS - 1)
+            await pipe.execute()
+        return
     
-    return html
+    bronze_storage.extend(record for _, record in batch)
+
+async def _load_records() -> List[BronzeTransHst2]:
+    """Stored records, newest first"""
+    if _redis is not None:
+        raw_records = await _redis.lrange(_REDIS_RECORDS_KEY, 0, MAX_STORED_RECORDS - 1)
+        return [_BRONZE_VALIDATOR.validate_json(raw_record) for raw_record in raw_records]
+    return list(reversed(bronze_storage))
+
+async def _reset_storage() -> int:
+    """Clear stored records and the counter, returning the previous count"""
+    global record_counter
+    
+    if _redis is not None:
+        async with _redis.pipeline(transaction=True) as pipe:
+            pipe.get(_REDIS_COUNTER_KEY)
+            pipe.delete(_REDIS_COUNTER_KEY, _REDIS_RECORDS_KEY)
+            pipe.incr(_REDIS_EPOCH_KEY)
+            old_count, _, _ = await pipe.execute()
+        return int(old_count or 0)
+    
+    old_count = record_counter
+    record_counter = 0
+    bronze_storage.clear()
+    return old_count
+
+# Background batch flusher
+async def _flush_pending_batch() -> bool:
+    """Store the flusher's pending batch; on failure it stays pending for a retry"""
+    async with _storage_lock:
+        if not _pending_batch:
+            return True
+        batch = _pending_batch[:]
+        _pending_batch.clear()
+        try:
+            await _store_records(batch)
+            logger.info(f"Flushed {len(batch)} bronze records to storage")
+            return True
+        except Exception as e:
+            # Put the batch back in front of anything added since
+            _pending_batch[:0] = batch
+            logger.error(f"Failed to store {len(batch)} bronze records, will retry: {e}")
+            return False
+
+async def _flusher():
+    """Drain the ingest queue into storage, up to BATCH_MAX_SIZE records or BATCH_MAX_DELAY_MS per batch"""
+    loop = asyncio.get_running_loop()
+    max_delay = BATCH_MAX_DELAY_MS / 1000
+    
+    try:
+        while True:
+            # A batch that failed to store is still pending; otherwise wait for the next record
+            if not _pending_batch:
+                _pending_batch.append(await _ingest_queue.get())
+            deadline = loop.time() + max_delay
+            
+            while len(_pending_batch) < BATCH_MAX_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    _pending_batch.append(await asyncio.wait_for(_ingest_queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            if not await _flush_pending_batch():
+                await asyncio.sleep(FLUSH_RETRY_DELAY)
+    finally:
+        # Store a partial batch when stopped mid-window
+        await _flush_pending_batch()
+
+def _start_flusher_task() -> None:
+    """Start the flusher task, restarting it if it ever stops unexpectedly"""
+    global _flusher_task
+    _flusher_task = asyncio.create_task(_flusher())
+    _flusher_task.add_done_callback(_on_flusher_done)
+
+def _on_flusher_done(task: asyncio.Task) -> None:
+    """Log an unexpected flusher exit and restart it after a short delay"""
+    if task.cancelled():
+        return
+    logger.error(f"Bronze batch flusher stopped unexpectedly: {task.exception()!r}; restarting")
+    asyncio.get_running_loop().call_later(1, _start_flusher_task)
+
+def _drain_ingest_queue() -> List[_QueuedRecord]:
+    """Take every record currently waiting in the ingest queue"""
+    pending = []
+    while not _ingest_queue.empty():
+        pending.append(_ingest_queue.get_nowait())
+    return pending
+
+def _require_ingest() -> None:
+    """Fail clearly when the ingest pipeline is not running (app lifespan not started)"""
+    if _ingest_queue is None or _storage_lock is None:
+        raise HTTPException(status_code=503, detail="Ingest pipeline is not running; the app lifespan has not been started")
+
+async def _start_ingest():
+    """Connect to Redis if configured and start the background batch flusher"""
+    global _ingest_queue, _storage_lock, _redis
+    
+    if REDIS_URL:
+        import redis.asyncio as aioredis
+        _redis = aioredis.from_url(REDIS_URL)
+        logger.info("Using Redis for bronze record storage")
+    
+    _ingest_queue = asyncio.Queue(maxsize=INGEST_QUEUE_MAX_SIZE)
+    _storage_lock = asyncio.Lock()
+    _pending_batch.clear()
+    _start_flusher_task()
+
+async def _stop_ingest():
+    """Stop the flusher, store any records still pending or queued and close Redis"""
+    global _ingest_queue, _storage_lock, _flusher_task, _redis
+    
+    if _flusher_task is not None:
+        # Cancel outside a store; the flusher stores its in-progress batch as it exits
+        async with _storage_lock:
+            _flusher_task.cancel()
+        try:
+            await _flusher_task
+        except asyncio.CancelledError:
+            pass
+        _flusher_task = None
+    
+    # Store whatever was still queued
+    _pending_batch.extend(_drain_ingest_queue())
+    if not await _flush_pending_batch():
+        logger.error(f"Dropping {len(_pending_batch)} bronze records that could not be stored at shutdown")
+    
+    _ingest_queue = None
+    _storage_lock = None
+    
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+# Fixed start of the POST response body; the count and record fields are appended per request
+_RECEIVE_RESPONSE_PREFIX = b'{"status":"success","message":"Bronze record received successfully","total_count":'
 
 # API Endpoints
 @app.post("/webhook/bronze-trans-hst2")
 async def receive_bronze_record(request: Request):
     """Receive bronze_dbo_trans_hst2 record from Confluent HTTP Sink Connector"""
-    global record_counter, bronze_storage
+    _require_ingest()
     
     try:
         # Get raw body
         raw_body = await request.body()
-        raw_data = raw_body.decode('utf-8')
         
-        logger.info(f"Received bronze record: {len(raw_data)} chars")
+        logger.info(f"Received bronze record: {len(raw_body)} bytes")
         
         # Parse the message
-        bronze_record = ConfluentMessageParser.parse_confluent_message(raw_data)
+        bronze_record = parse_confluent_message(raw_body)
         
-        # Store record
-        bronze_storage.append(bronze_record)
-        record_counter += 1
+        # Serialize the record fields of the response before the record is counted or queued,
+        # so a serialization failure can't leave a stored record behind a 400 (orjson handles received_at natively)
+        record_json = orjson.dumps({
+            "record_id": bronze_record.record_id,
+            "processing_id": bronze_record.processing_id,
+            "received_at": bronze_record.received_at
+        })
         
-        # Keep only last 10 records
-        if len(bronze_storage) > 10:
-            bronze_storage = bronze_storage[-10:]
+        # Count first: if Redis fails here nothing is queued, so a sink retry can't store it twice
+        total_count, epoch = await _count_record()
         
-        logger.info(f"Bronze record processed. Total: {record_counter}, Record ID: {bronze_record.record_id}")
+        # Queue record; the flusher stores it (only the last 10 records are kept)
+        await _ingest_queue.put((epoch, bronze_record))
         
-        return {
-            "status": "success",
-            "message": "Bronze record received successfully",
-            "total_count": record_counter,
-            "record_id": bronze_record.record_id,
-            "processing_id": bronze_record.processing_id,
-            "received_at": bronze_record.received_at.isoformat()
-        }
+        logger.info(f"Bronze record queued. Total: {total_count}, Record ID: {bronze_record.record_id}")
+        
+        return Response(
+            content=_RECEIVE_RESPONSE_PREFIX + str(total_count).encode() + b"," + record_json[1:],
+            media_type="application/json"
+        )
         
     except Exception as e:
         logger.error(f"Error processing bronze record: {e}")
@@ -316,13 +533,11 @@ async def receive_bronze_record(request: Request):
 @app.get("/webhook/bronze-trans-hst2")
 async def get_bronze_records():
     """Get bronze record statistics and last 10 records"""
-    global record_counter, bronze_storage
-    
-    # Reverse to show newest first
-    last_records = list(reversed(bronze_storage))
+    # Newest first
+    last_records = await _load_records()
     
     response = BronzeResponse(
-        total_received=record_counter,
+        total_received=await _get_record_count(),
         last_10_records=last_records,
         last_updated=datetime.now()
     )
@@ -332,31 +547,34 @@ async def get_bronze_records():
 @app.get("/webhook/bronze-trans-hst2/stats")
 async def get_bronze_stats():
     """Get detailed statistics about received records"""
-    global record_counter, bronze_storage
+    stored_records = await _load_records()
     
-    # Calculate some statistics
-    record_ids = [r.record_id for r in bronze_storage if r.record_id]
-    unique_users = set([r.creat_usrnbr for r in bronze_storage if r.creat_usrnbr])
+    # Calculate some statistics in a single pass
+    record_ids = set()
+    unique_users = set()
+    last_record_id = None
+    for r in stored_records:
+        record_id = r.record_id
+        if record_id:
+            record_ids.add(record_id)
+            if last_record_id is None or record_id > last_record_id:
+                last_record_id = record_id
+        creat_usrnbr = r.creat_usrnbr
+        if creat_usrnbr:
+            unique_users.add(creat_usrnbr)
     
     return {
-        "total_records": record_counter,
-        "current_storage": len(bronze_storage),
-        "unique_record_ids": len(set(record_ids)) if record_ids else 0,
+        "total_records": await _get_record_count(),
+        "current_storage": len(stored_records),
+        "unique_record_ids": len(record_ids),
         "unique_users": len(unique_users),
-        "last_record_id": max(record_ids) if record_ids else None,
+        "last_record_id": last_record_id,
         "service_uptime": "active",
         "timestamp": datetime.now().isoformat()
     }
 
-@app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard():
-    """Web dashboard showing last 10 records"""
-    global record_counter, bronze_storage
-    
-    # Get last 10 records (newest first)
-    last_records = list(reversed(bronze_storage))
-    
-    html_content = f"""
+# Static dashboard shell, encoded once; only the stats/records region is built per request
+_DASHBOARD_PREFIX: bytes = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -364,113 +582,113 @@ async def dashboard():
         <meta charset="utf-8">
         <meta name="viewport" content="width=device-width, initial-scale=1">
         <style>
-            body {{
+            body {
                 font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                 margin: 0;
                 padding: 20px;
                 background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                 color: #333;
                 min-height: 100vh;
-            }}
-            .container {{
+            }
+            .container {
                 max-width: 1200px;
                 margin: 0 auto;
                 background: white;
                 border-radius: 10px;
                 box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
                 overflow: hidden;
-            }}
-            .header {{
+            }
+            .header {
                 background: #2c3e50;
                 color: white;
                 padding: 20px;
                 text-align: center;
-            }}
-            .header h1 {{
+            }
+            .header h1 {
                 margin: 0;
                 font-size: 24px;
-            }}
-            .stats {{
+            }
+            .stats {
                 display: flex;
                 background: #ecf0f1;
                 padding: 15px;
                 justify-content: space-around;
                 border-bottom: 1px solid #bdc3c7;
-            }}
-            .stat-item {{
+            }
+            .stat-item {
                 text-align: center;
-            }}
-            .stat-number {{
+            }
+            .stat-number {
                 font-size: 24px;
                 font-weight: bold;
                 color: #27ae60;
-            }}
-            .stat-label {{
+            }
+            .stat-label {
                 font-size: 12px;
                 color: #7f8c8d;
                 text-transform: uppercase;
-            }}
-            .records-section {{
+            }
+            .records-section {
                 padding: 20px;
-            }}
-            .records-title {{
+            }
+            .records-title {
                 margin: 0 0 20px 0;
                 color: #2c3e50;
                 border-bottom: 2px solid #3498db;
                 padding-bottom: 10px;
-            }}
-            .record-card {{
+            }
+            .record-card {
                 background: #f8f9fa;
                 border: 1px solid #e9ecef;
                 border-radius: 8px;
                 margin-bottom: 15px;
                 padding: 15px;
                 transition: transform 0.2s;
-            }}
-            .record-card:hover {{
+            }
+            .record-card:hover {
                 transform: translateY(-2px);
                 box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-            }}
-            .record-header {{
+            }
+            .record-header {
                 display: flex;
                 justify-content: space-between;
                 align-items: center;
                 margin-bottom: 10px;
                 padding-bottom: 8px;
                 border-bottom: 1px solid #dee2e6;
-            }}
-            .record-id {{
+            }
+            .record-id {
                 font-weight: bold;
                 color: #e74c3c;
                 font-size: 16px;
-            }}
-            .received-time {{
+            }
+            .received-time {
                 color: #7f8c8d;
                 font-size: 12px;
-            }}
-            .record-fields {{
+            }
+            .record-fields {
                 display: grid;
                 grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
                 gap: 8px;
-            }}
-            .field {{
+            }
+            .field {
                 font-size: 12px;
-            }}
-            .field-name {{
+            }
+            .field-name {
                 font-weight: bold;
                 color: #34495e;
-            }}
-            .field-value {{
+            }
+            .field-value {
                 color: #2c3e50;
                 margin-left: 5px;
-            }}
-            .no-records {{
+            }
+            .no-records {
                 text-align: center;
                 color: #7f8c8d;
                 padding: 40px;
                 font-style: italic;
-            }}
-            .refresh-btn {{
+            }
+            .refresh-btn {
                 position: fixed;
                 bottom: 20px;
                 right: 20px;
@@ -482,23 +700,23 @@ async def dashboard():
                 cursor: pointer;
                 box-shadow: 0 4px 6px rgba(0,0,0,0.1);
                 font-weight: bold;
-            }}
-            .refresh-btn:hover {{
+            }
+            .refresh-btn:hover {
                 background: #2980b9;
-            }}
-            .status-badge {{
+            }
+            .status-badge {
                 background: #27ae60;
                 color: white;
                 padding: 4px 8px;
                 border-radius: 12px;
                 font-size: 10px;
                 text-transform: uppercase;
-            }}
+            }
         </style>
         <script>
-            function refreshPage() {{
+            function refreshPage() {
                 window.location.reload();
-            }}
+            }
             
             // Auto refresh every 30 seconds
             setInterval(refreshPage, 30000);
@@ -511,13 +729,31 @@ async def dashboard():
                 <span class="status-badge">Live Monitoring</span>
             </div>
             
-            <div class="stats">
+            <div class="stats">""".encode('utf-8')
+
+_DASHBOARD_SUFFIX: bytes = """
+            </div>
+        </div>
+        
+        <button class="refresh-btn" onclick="refreshPage()">🔄 Refresh Now</button>
+    </body>
+    </html>
+    """.encode('utf-8')
+
+@app.get("/dashboard", response_class=HTMLResponse)
+async def dashboard():
+    """Web dashboard showing last 10 records"""
+    # Get last 10 records (newest first)
+    last_records = await _load_records()
+    total_records = await _get_record_count()
+    
+    middle = f"""
                 <div class="stat-item">
-                    <div class="stat-number">{record_counter}</div>
+                    <div class="stat-number">{total_records}</div>
                     <div class="stat-label">Total Records</div>
                 </div>
                 <div class="stat-item">
-                    <div class="stat-number">{len(bronze_storage)}</div>
+                    <div class="stat-number">{len(last_records)}</div>
                     <div class="stat-label">In Memory</div>
                 </div>
                 <div class="stat-item">
@@ -533,25 +769,20 @@ async def dashboard():
             <div class="records-section">
                 <h2 class="records-title">📊 Last 10 Records (Newest First)</h2>
                 
-                {_generate_records_html(last_records)}
-            </div>
-        </div>
-        
-        <button class="refresh-btn" onclick="refreshPage()">🔄 Refresh Now</button>
-    </body>
-    </html>
-    """
+                {_generate_records_html(last_records)}"""
     
-    return html_content
+    return HTMLResponse(content=_DASHBOARD_PREFIX + middle.encode('utf-8') + _DASHBOARD_SUFFIX)
 
 @app.post("/webhook/bronze-trans-hst2/reset")
 async def reset_bronze_counters():
     """Reset bronze record counters and storage"""
-    global record_counter, bronze_storage
+    _require_ingest()
     
-    old_count = record_counter
-    record_counter = 0
-    bronze_storage = []
+    # Under the storage lock so no batch taken before the reset is stored after it
+    async with _storage_lock:
+        _drain_ingest_queue()
+        _pending_batch.clear()
+        old_count = await _reset_storage()
     
     logger.info(f"Bronze counters reset. Previous count: {old_count}")
     
@@ -561,39 +792,52 @@ async def reset_bronze_counters():
         "timestamp": datetime.now().isoformat()
     }
 
-@app.get("/health")
+# Static probe payloads; /health only stamps timestamp and total_processed per call
+_HEALTH_BASE = {
+    "status": "healthy",
+    "service": "bronze-dbo-trans-hst2-webhook",
+    "version": "2.0.0",
+    "timestamp": None,
+    "total_processed": None,
+    "uptime_info": "running"
+}
+
+_ROOT_JSON: bytes = orjson.dumps({
+    "message": "Bronze DBO Trans HST2 Webhook Service",
+    "version": "2.0.0",
+    "kafka_topic": "bronze_dbo_trans_hst2",
+    "connector_type": "confluent_http_sink",
+    "endpoints": {
+        "dashboard": "/dashboard",
+        "webhook_post": "/webhook/bronze-trans-hst2",
+        "webhook_get": "/webhook/bronze-trans-hst2",
+        "stats": "/webhook/bronze-trans-hst2/stats",
+        "reset": "/webhook/bronze-trans-hst2/reset",
+        "health": "/health",
+        "docs": "/docs"
+    },
+    "azure_deployment": "ready",
+    "github_integration": "supported"
+})
+
+@app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
-    return HealthResponse(
-        status="healthy",
-        service="bronze-dbo-trans-hst2-webhook",
-        version="2.0.0",
-        timestamp=datetime.now(),
-        total_processed=record_counter,
-        uptime_info="running"
-    )
+    health = {**_HEALTH_BASE, "timestamp": datetime.now(), "total_processed": await _get_record_count()}
+    return Response(content=orjson.dumps(health), media_type="application/json")
 
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
-    return {
-        "message": "Bronze DBO Trans HST2 Webhook Service",
-        "version": "2.0.0",
-        "kafka_topic": "bronze_dbo_trans_hst2",
-        "connector_type": "confluent_http_sink",
-        "endpoints": {
-            "dashboard": "/dashboard",
-            "webhook_post": "/webhook/bronze-trans-hst2",
-            "webhook_get": "/webhook/bronze-trans-hst2",
-            "stats": "/webhook/bronze-trans-hst2/stats",
-            "reset": "/webhook/bronze-trans-hst2/reset",
-            "health": "/health",
-            "docs": "/docs"
-        },
-        "azure_deployment": "ready",
-        "github_integration": "supported"
-    }
+    return Response(content=_ROOT_JSON, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvicorn's default loop/http "auto" picks uvloop and httptools when installed
+    # (uvloop is not available on Windows, where the asyncio loop is used).
+    # Multiple workers need REDIS_URL; without it records and counters live in process memory.
+    if REDIS_URL:
+        workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file